@@ -1,13 +1,14 @@
-from pathlib import Path
 import matplotlib
+
+matplotlib.use("pdf")
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 
-matplotlib.use("pdf")
-
-
 def external_fn_with_internal_fn():
     def internal_fn(x):
         return np.sqrt(x)
@@ -18,24 +19,46 @@ def external_fn_with_internal_fn():
 def create_figure_with_external_fn_with_internal_fn(data: pd.DataFrame):
     fig, ax = plt.subplots()
     preprocessor = external_fn_with_internal_fn()
-    data["x"] = preprocessor(data["x"])
-    ax.plot(data["x"], data["y"])
+    # x holds integers, so it is converted once rather than
+    # assigning a new float column back into the data frame
+    x = preprocessor(data["x"].to_numpy(dtype=float))
+    ax.plot(x, data["y"])
     return fig
 
 
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(
+        _FIGURE_DIR.glob("data_*.csv"),
+        key=lambda path: int(path.stem.rsplit("_", 1)[1]),
+    )
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
+
+
 def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(
-            Path("figures/test_fig_external_fn_with_internal_fn").glob("data_*.csv")
-        )
-    ]
+    data = _load_figure_data()
     fig = create_figure_with_external_fn_with_internal_fn(*data)
+    if fig is None:
+        fig = plt.gcf()
     fig.savefig(
-        "figures/test_fig_external_fn_with_internal_fn/test_fig_external_fn_with_internal_fn.pdf",
+        _FIGURE_DIR / "test_fig_external_fn_with_internal_fn.pdf",
         bbox_inches="tight",
-        dpi=1000,
+        dpi=300,
     )
+    return fig
 
 
 if __name__ == "__main__":
@@ -1,51 +1,70 @@
-from math import sqrt
-from pathlib import Path
 import matplotlib
+
+matplotlib.use("pdf")
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 
-matplotlib.use("pdf")
-
-
-def external_fn(x):
-    return np.sqrt(x)
+def external_fn(x: np.ndarray) -> np.ndarray:
+    return np.sqrt(x, out=x)
 
 
 class HelperClass:
+
     def __init__(self, a: int):
         self.a = a
 
-    def internal_fn(self, x):
-        return x * self.a
+    def internal_fn(self, x: np.ndarray) -> np.ndarray:
+        return np.multiply(x, self.a, out=x)
 
-    def preprocess_data(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Preprocess data."""
-        data["y"] = self.internal_fn(data["y"])
-        data["x"] = external_fn(data["x"])
-        return data
+    def preprocess_data(self, data: pd.DataFrame) -> tuple:
+        """Preprocess data, returning the x and y values to plot."""
+        x = data["x"].to_numpy(dtype=float, copy=True)
+        y = data["y"].to_numpy(dtype=float, copy=True)
+        return external_fn(x), self.internal_fn(y)
 
 
 def create_figure_with_helper_class(data: pd.DataFrame):
     fig, ax = plt.subplots()
     helper_class = HelperClass(a=10)
-    data = helper_class.preprocess_data(data)
-    ax.plot(data["x"], data["y"])
+    x, y = helper_class.preprocess_data(data)
+    ax.plot(x, y)
     return fig
 
 
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(
+        _FIGURE_DIR.glob("data_*.csv"),
+        key=lambda path: int(path.stem.rsplit("_", 1)[1]),
+    )
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
+
+
 def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(Path("figures/test_fig_helper_class").glob("data_*.csv"))
-    ]
+    data = _load_figure_data()
     fig = create_figure_with_helper_class(*data)
-    fig.savefig(
-        "figures/test_fig_helper_class/test_fig_helper_class.pdf",
-        bbox_inches="tight",
-        dpi=1000,
-    )
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(_FIGURE_DIR / "test_fig_helper_class.pdf", bbox_inches="tight", dpi=300)
+    return fig
 
 
 if __name__ == "__main__":
@@ -1,30 +1,51 @@
+import matplotlib
+
+matplotlib.use("pdf")
+
+from concurrent.futures import ThreadPoolExecutor
 from math import sqrt
 from pathlib import Path
-import matplotlib
 import matplotlib.pyplot as plt
 import pandas as pd
 
 
-matplotlib.use("pdf")
-
-
 def create_figure_test_import_from(data: pd.DataFrame):
+    # no figure is returned, to test saving the current pyplot figure
     _, ax = plt.subplots()
+    # sqrt is deliberately called here to test `from ... import ...` imports
     k = sqrt(4)
-    ax.plot(data["x"], k * data["y"])
+    ax.plot(data["x"].to_numpy(), k * data["y"].to_numpy())
 
 
-def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(Path("figures/test_fig_import_from").glob("data_*.csv"))
-    ]
-    create_figure_test_import_from(*data)
-    plt.savefig(
-        "figures/test_fig_import_from/test_fig_import_from.pdf",
-        bbox_inches="tight",
-        dpi=1000,
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(
+        _FIGURE_DIR.glob("data_*.csv"),
+        key=lambda path: int(path.stem.rsplit("_", 1)[1]),
     )
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
+
+
+def reproduce_figure():
+    data = _load_figure_data()
+    fig = create_figure_test_import_from(*data)
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(_FIGURE_DIR / "test_fig_import_from.pdf", bbox_inches="tight", dpi=300)
+    return fig
 
 
 if __name__ == "__main__":
@@ -1,31 +1,51 @@
-from pathlib import Path
 import matplotlib
-import matplotlib.pyplot as plt
-import pandas as pd
-
 
 matplotlib.use("pdf")
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import matplotlib.pyplot as plt
+import pandas as pd
+
 
 def create_test_figure_with_kwargs(data: pd.DataFrame, value: float) -> plt.Figure:
     """Create a figure."""
     fig, ax = plt.subplots()
-    ax.plot(data.x, data.y)
-    ax.hlines(value, data.x.min(), data.x.max())
+    x = data.x.to_numpy()
+    ax.plot(x, data.y)
+    ax.hlines(value, x.min(), x.max())
     return fig
 
 
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(
+        _FIGURE_DIR.glob("data_*.csv"),
+        key=lambda path: int(path.stem.rsplit("_", 1)[1]),
+    )
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
+
+
 def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(Path("figures/test_fig_with_kwargs").glob("data_*.csv"))
-    ]
+    data = _load_figure_data()
     fig = create_test_figure_with_kwargs(*data, value=-0.0014064872432473408)
-    fig.savefig(
-        "figures/test_fig_with_kwargs/test_fig_with_kwargs.pdf",
-        bbox_inches="tight",
-        dpi=1000,
-    )
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(_FIGURE_DIR / "test_fig_with_kwargs.pdf", bbox_inches="tight", dpi=300)
+    return fig
 
 
 if __name__ == "__main__":
@@ -1,13 +1,14 @@
+import matplotlib
+
+matplotlib.use("pdf")
+
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from reproducible_figures.plotting import set_plotting_style
-import matplotlib
 import matplotlib.pyplot as plt
 import pandas as pd
 
 
-matplotlib.use("pdf")
-
-
 def create_test_figure(data: pd.DataFrame) -> plt.Figure:
     """Create a figure."""
     fig, ax = plt.subplots()
@@ -17,22 +18,40 @@ def create_test_figure(data: pd.DataFrame) -> plt.Figure:
 
 def create_figure_with_plotting_style(data: pd.DataFrame):
     set_plotting_style()
-    create_test_figure(data)
+    return create_test_figure(data)
+
+
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(
+        _FIGURE_DIR.glob("data_*.csv"),
+        key=lambda path: int(path.stem.rsplit("_", 1)[1]),
+    )
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
 
 
 def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(
-            Path("figures/test_fig_with_plotting_style").glob("data_*.csv")
-        )
-    ]
-    create_figure_with_plotting_style(*data)
-    plt.savefig(
-        "figures/test_fig_with_plotting_style/test_fig_with_plotting_style.pdf",
-        bbox_inches="tight",
-        dpi=1000,
+    data = _load_figure_data()
+    fig = create_figure_with_plotting_style(*data)
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(
+        _FIGURE_DIR / "test_fig_with_plotting_style.pdf", bbox_inches="tight", dpi=300
     )
+    return fig
 
 
 if __name__ == "__main__":
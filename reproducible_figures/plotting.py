@@ -1,22 +1,26 @@
-from typing import List, Optional
-import subprocess
-import seaborn as sns
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import shutil
 
+import matplotlib
 
+
+# arguments of the last call to set_plotting_style and the rcParams it left,
+# used to skip re-applying the same style when many figures are created in
+# one process. The style is re-applied if the rcParams have since changed
+# (e.g. by plt.style.use or matplotlib.rcdefaults)
+_applied_style: Optional[Tuple[tuple, dict]] = None
+
+
+@lru_cache(maxsize=1)
 def is_tex_available() -> bool:
     """
     Check if TeX/LaTeX is installed on the system.
+    The result is cached, as it will not change while the process is running.
     """
-    try:
-        # Attempt to run the 'tex --version' command to check for TeX/LaTeX installation
-        subprocess.run(["tex", "--version"],
-                       check=True,
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        # If the command fails or is not found, TeX is likely not installed
-        return False
+    # Finding the 'tex' executable on the PATH is enough to use usetex,
+    # and avoids spawning a process to run it
+    return shutil.which('tex') is not None
 
 
 def get_latex_preamble_string(latex_packages: List[str]) -> str:
@@ -26,18 +30,36 @@ def get_latex_preamble_string(latex_packages: List[str]) -> str:
 def set_plotting_style(font_scale: float = 1.5,
                        use_times_font: bool = True,
                        latex_packages: Optional[List[str]] = None,
-                       rc: Optional[dict] = None):
+                       rc: Optional[dict] = None,
+                       simplify_threshold: Optional[float] = None):
     """
     Set the default plotting style for matplotlib and seaborn.
+    Calling this again with the same arguments does nothing, unless
+    matplotlib's settings have been changed since.
+
+    Passing simplify_threshold (e.g. 0.5, where matplotlib's default is 1/9)
+    simplifies dense lines more aggressively, which makes vector figures
+    with many points smaller and quicker to save, but can change how they
+    look. By default matplotlib's path simplification settings are used.
     """
+    global _applied_style
+    style = (font_scale, use_times_font, list(latex_packages or []),
+             dict(rc or {}), simplify_threshold)
+    if _applied_style is not None and _applied_style[0] == style \
+            and _applied_style[1] == dict(matplotlib.rcParams):
+        return
+
     use_tex = is_tex_available()
     default_rc = {
         'font.family':'serif',
         "text.usetex": use_tex,
         'savefig.facecolor': 'white',
     }
+    if simplify_threshold is not None:
+        default_rc['path.simplify'] = True
+        default_rc['path.simplify_threshold'] = simplify_threshold
     if use_tex:
-        latex_packages = latex_packages or []
+        latex_packages = list(latex_packages or [])
         if use_times_font:
             latex_packages.append('times')
         if latex_packages:
@@ -46,4 +68,18 @@ def set_plotting_style(font_scale: float = 1.5,
 
     rc = {**default_rc, **(rc or {})}
 
+    # seaborn is slow to import and only needed here, so it is
+    # imported on first use rather than with the package
+    import seaborn as sns
     sns.set(font_scale=font_scale, rc=rc)
+    _applied_style = (style, dict(matplotlib.rcParams))
+
+
+def reset_plotting_style():
+    """
+    Restore the style from the user's matplotlibrc (or matplotlib's defaults
+    if there is none), undoing any previous call to set_plotting_style.
+    """
+    global _applied_style
+    matplotlib.rc_file_defaults()
+    _applied_style = None
@@ -0,0 +1,108 @@
+"""
+Reproduces all of the figures in a figures directory in a single process,
+so that matplotlib, pandas, etc. are only imported once rather than once
+for every figure.
+
+Usage:
+    python -m reproducible_figures.reproduce_all [figures_dir] [--only-outdated]
+"""
+from types import ModuleType
+from typing import List, Optional
+
+from pathlib import Path
+import argparse
+import importlib.util
+import sys
+
+import matplotlib.pyplot as plt
+
+from .plotting import reset_plotting_style
+
+
+def load_figure_module(code_path: Path) -> ModuleType:
+    """Loads the code.py file of a saved figure as a module."""
+    module_name = f'reproducible_figures_{code_path.parent.name}'
+    spec = importlib.util.spec_from_file_location(module_name, code_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def is_up_to_date(figure_dir: Path) -> bool:
+    """
+    Checks whether the figure files in a saved figure's directory were
+    all written after its code.py and data were last modified.
+
+    Only code.py and the data files are checked, so a change to a module
+    that code.py imports from is not detected.
+    """
+    figure_paths = list(figure_dir.glob(f'{figure_dir.name}.*'))
+    if not figure_paths:
+        return False
+
+    source_paths = [figure_dir / 'code.py', *figure_dir.glob('data_*')]
+    last_source_change = max(path.stat().st_mtime_ns for path in source_paths)
+    return all(path.stat().st_mtime_ns > last_source_change
+               for path in figure_paths)
+
+
+def reproduce_all(figures_dir: str = 'figures',
+                  only_outdated: bool = False,
+                  failed: Optional[List[str]] = None) -> List[str]:
+    """
+    Reproduces every figure saved in figures_dir by running the
+    reproduce_figure function of each figure's code.py.
+
+    The plotting style is reset and all figures are closed after each
+    figure, so that styles do not leak from one figure into the next.
+
+    Args:
+        figures_dir: Directory containing the saved figures.
+            Default is 'figures'.
+        only_outdated: Whether to skip figures whose figure file is newer
+            than their code.py and data, as rendering them again would give
+            the same figure. Default is False.
+        failed: List that the names of the figures that could not be
+            reproduced are appended to.
+
+    Returns:
+        The names of the figures that were reproduced successfully.
+    """
+    reproduced = []
+    for code_path in sorted(Path(figures_dir).glob('*/code.py')):
+        fig_name = code_path.parent.name
+        if only_outdated and is_up_to_date(code_path.parent):
+            continue
+
+        try:
+            load_figure_module(code_path).reproduce_figure()
+            reproduced.append(fig_name)
+
+        except Exception as e:
+            print(f'Failed to reproduce {fig_name}: {e}')
+            if failed is not None:
+                failed.append(fig_name)
+
+        finally:
+            plt.close('all')
+            reset_plotting_style()
+
+    return reproduced
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description='Reproduce all figures saved in a figures directory.')
+    parser.add_argument('figures_dir', nargs='?', default='figures')
+    parser.add_argument('--only-outdated', action='store_true',
+                        help='Skip figures that are newer than their code and data.')
+    args = parser.parse_args()
+    failed = []
+    reproduce_all(args.figures_dir, only_outdated=args.only_outdated,
+                  failed=failed)
+    # a non-zero exit status lets CI jobs detect figures that are broken
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import matplotlib
+
+# select the backend before any test module imports pyplot,
+# so that pyplot is never set up with the default backend
+matplotlib.use('pdf')
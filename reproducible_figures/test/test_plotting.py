@@ -0,0 +1,57 @@
+from ..plotting import reset_plotting_style, set_plotting_style
+
+import matplotlib
+
+
+def test_set_plotting_style_applied_once(monkeypatch):
+    """Test repeated calls with the same style are skipped."""
+    import seaborn as sns
+    set_plotting_style(rc={'lines.linewidth': 3.0})
+    assert matplotlib.rcParams['lines.linewidth'] == 3.0
+
+    calls = []
+    monkeypatch.setattr(sns, 'set', lambda *args, **kwargs: calls.append(1))
+    set_plotting_style(rc={'lines.linewidth': 3.0})
+    assert calls == []
+
+    monkeypatch.undo()
+    set_plotting_style(rc={'lines.linewidth': 2.0})
+    assert matplotlib.rcParams['lines.linewidth'] == 2.0
+    reset_plotting_style()
+
+
+def test_set_plotting_style_reapplied_after_rc_changes():
+    """Test the style is re-applied if matplotlib's settings changed."""
+    set_plotting_style(rc={'lines.linewidth': 3.0})
+
+    matplotlib.rcParams['lines.linewidth'] = 1.0
+    set_plotting_style(rc={'lines.linewidth': 3.0})
+    assert matplotlib.rcParams['lines.linewidth'] == 3.0
+
+    matplotlib.rcdefaults()
+    set_plotting_style(rc={'lines.linewidth': 3.0})
+    assert matplotlib.rcParams['lines.linewidth'] == 3.0
+    assert matplotlib.rcParams['font.family'] == ['serif']
+    reset_plotting_style()
+
+
+def test_reset_plotting_style_restores_matplotlibrc(monkeypatch):
+    """Test the style is reset to the user's matplotlibrc."""
+    monkeypatch.setitem(matplotlib.rcParamsOrig, 'lines.linewidth', 4.0)
+    set_plotting_style(rc={'lines.linewidth': 2.0})
+    reset_plotting_style()
+    assert matplotlib.rcParams['lines.linewidth'] == 4.0
+
+    monkeypatch.undo()
+    reset_plotting_style()
+
+
+def test_set_plotting_style_simplify_threshold():
+    """Test path simplification is only changed when asked for."""
+    default_threshold = matplotlib.rcParams['path.simplify_threshold']
+    set_plotting_style()
+    assert matplotlib.rcParams['path.simplify_threshold'] == default_threshold
+
+    set_plotting_style(simplify_threshold=0.5)
+    assert matplotlib.rcParams['path.simplify_threshold'] == 0.5
+    reset_plotting_style()
@@ -0,0 +1,54 @@
+import os
+
+from ..reproduce_all import main, reproduce_all
+from ..utility import save_reproducible_figure
+from .test_save_figure import create_test_figure, generate_random_data
+
+
+def test_reproduce_all(tmp_path):
+    figures_dir = str(tmp_path)
+    for fig_name in ['fig_a', 'fig_b']:
+        save_reproducible_figure(fig_name, generate_random_data(),
+                                 create_test_figure,
+                                 figures_dir=figures_dir,
+                                 auto_format=False)
+        (tmp_path / fig_name / f'{fig_name}.pdf').unlink()
+
+    assert reproduce_all(figures_dir) == ['fig_a', 'fig_b']
+    assert (tmp_path / 'fig_a' / 'fig_a.pdf').exists()
+    assert (tmp_path / 'fig_b' / 'fig_b.pdf').exists()
+
+
+def test_reproduce_all_only_outdated(tmp_path):
+    figures_dir = str(tmp_path)
+    for fig_name in ['fig_a', 'fig_b']:
+        save_reproducible_figure(fig_name, generate_random_data(),
+                                 create_test_figure,
+                                 figures_dir=figures_dir,
+                                 auto_format=False)
+
+    # fig_a is newer than its code and data, fig_b has had its code edited
+    figure_path = tmp_path / 'fig_a' / 'fig_a.pdf'
+    figure_modified = (tmp_path / 'fig_a' / 'code.py').stat().st_mtime_ns + 10**9
+    os.utime(figure_path, ns=(figure_modified, figure_modified))
+    code_path = tmp_path / 'fig_b' / 'code.py'
+    code_modified = (tmp_path / 'fig_b' / 'fig_b.pdf').stat().st_mtime_ns + 10**9
+    os.utime(code_path, ns=(code_modified, code_modified))
+
+    assert reproduce_all(figures_dir, only_outdated=True) == ['fig_b']
+    assert figure_path.stat().st_mtime_ns == figure_modified
+
+
+def test_main_fails_when_a_figure_fails(tmp_path, monkeypatch):
+    save_reproducible_figure('fig_a', generate_random_data(),
+                             create_test_figure,
+                             figures_dir=str(tmp_path),
+                             auto_format=False)
+    (tmp_path / 'fig_b').mkdir()
+    (tmp_path / 'fig_b' / 'code.py').write_text('raise RuntimeError()\n')
+
+    monkeypatch.setattr('sys.argv', ['reproduce_all', str(tmp_path)])
+    assert main() == 1
+
+    (tmp_path / 'fig_b' / 'code.py').unlink()
+    assert main() == 0
@@ -1,34 +1,33 @@
-from cycler import V
 from reproducible_figures.plotting import set_plotting_style
+from ..reproduce_all import load_figure_module
+from .. import utility
 from ..utility import save_reproducible_figure
 
 from pathlib import Path
+import runpy
 import subprocess
 
 import pandas as pd
-import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import networkx as nx
+import pytest
 from math import sqrt
 
 
-matplotlib.use('pdf')
-
-
 GLOBAL_COL_TO_USE = 'z'
 
 
 def generate_random_data(n_points: int = 1000) -> pd.DataFrame:
     """Generate random sine wave data."""
-    df = pd.DataFrame({
-        'x': range(n_points),
-        'y': np.random.normal(size=n_points)
-    })
+    x = np.arange(n_points)
 
-    df['y'] = np.sin(df['x'] * 2 * np.pi / 1000) + 0.2 * df['y']
+    # computed in a single buffer to avoid allocating intermediate arrays
+    y = np.multiply(x, 2 * np.pi / 1000)
+    np.sin(y, out=y)
+    y += np.random.normal(scale=0.2, size=n_points)
 
-    return df
+    return pd.DataFrame({'x': x, 'y': y})
 
 
 def create_test_figure(data: pd.DataFrame) -> plt.Figure:
@@ -38,105 +37,315 @@ def create_test_figure(data: pd.DataFrame) -> plt.Figure:
     return fig
 
 
-def run_checks_after_saving(fig_name: str, check_code_runs: bool = True):
+def run_checks_after_saving(fig_name: str,
+                            figures_dir: str,
+                            check_code_runs: bool = True,
+                            in_subprocess: bool = False):
 
-    figure_dir = f'figures/{fig_name}'
+    figure_dir = f'{figures_dir}/{fig_name}'
 
     assert Path(f'{figure_dir}/{fig_name}.pdf').exists()
-    assert len(list(Path(figure_dir).glob('data_*.csv'))) > 0
+    assert len(list(Path(figure_dir).glob('data_*'))) > 0
     assert Path(f'{figure_dir}/code.py').exists()
 
     if check_code_runs:
-        with open(f'{figure_dir}/{fig_name}.pdf') as f:
-            figure_file_before = f.buffer.read()
+        # the pdf contents only change with the creation date, which has a
+        # resolution of one second, so compare modification times instead
+        figure_path = Path(f'{figure_dir}/{fig_name}.pdf')
+        modified_before = figure_path.stat().st_mtime_ns
+
+        if in_subprocess:
+            # a fresh interpreter checks that code.py has every import it needs,
+            # and it is run from the figure's directory, as code.py should not
+            # depend on the cwd
+            res = subprocess.run(['python', 'code.py'], cwd=figure_dir)
+            assert res.returncode == 0, \
+                f"Running code.py should not return an error code: {res.stderr}"
+        else:
+            # running in this process avoids importing pandas, matplotlib,
+            # etc. again for every test
+            runpy.run_path(f'{figure_dir}/code.py', run_name='__main__')
+            plt.close('all')
+
+        assert figure_path.stat().st_mtime_ns != modified_before, \
+            "Figure file should have been modified after running code.py"
 
-        res = subprocess.run(['python', f'{figure_dir}/code.py'])
-        assert res.returncode == 0, \
-            f"Running code.py should not return an error code: {res.stderr}"
 
-        with open(f'{figure_dir}/{fig_name}.pdf') as f:
-            figure_file_after = f.buffer.read()
+def test_simple_save_figure(tmp_path):
+    data = generate_random_data()
+    fig_name = 'test_fig'
+    save_reproducible_figure(fig_name, data, create_test_figure,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path),
+                            in_subprocess=True)
 
-        assert figure_file_before != figure_file_after, \
-            "Figure file should have been modified after running code.py"
+
+def test_save_figure_with_default_dpi(tmp_path):
+    data = generate_random_data()
+    fig_name = 'test_fig_default_dpi'
+    save_reproducible_figure(fig_name, data, create_test_figure,
+                             figures_dir=str(tmp_path), figure_dpi=None)
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
-def test_simple_save_figure():
+@pytest.mark.parametrize('data_format', ['feather', 'parquet', 'npy'])
+def test_save_figure_binary_data_format(tmp_path, data_format: str):
+    if data_format != 'npy':
+        pytest.importorskip('pyarrow')
     data = generate_random_data()
-    fig_name = 'test_fig'
-    save_reproducible_figure(fig_name, data, create_test_figure)
-    run_checks_after_saving(fig_name)
+    fig_name = f'test_fig_{data_format}'
+    save_reproducible_figure(fig_name, data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format=data_format)
+    assert (tmp_path / fig_name / f'data_0.{data_format}').exists()
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
+
+
+def test_save_figure_unsupported_data_saved_as_csv(tmp_path):
+    pytest.importorskip('pyarrow')
+    data = generate_random_data()
+    # pyarrow cannot convert columns of mixed types
+    data['label'] = ['a', 1] * (len(data) // 2)
+    save_reproducible_figure('test_fig', data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format='parquet',
+                             auto_format=False)
+    assert (tmp_path / 'test_fig' / 'data_0.csv').exists()
+
+
+def test_save_figure_non_numeric_npy_saved_as_csv(tmp_path):
+    data = generate_random_data()
+    data['label'] = 'a'
+    save_reproducible_figure('test_fig', data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format='npy',
+                             auto_format=False)
+    assert (tmp_path / 'test_fig' / 'data_0.csv').exists()
+    assert not (tmp_path / 'test_fig' / 'data_0.npy').exists()
+
+
+def test_save_data_fallback_removes_partial_files(tmp_path):
+    data = generate_random_data()
+    non_numeric_data = data.assign(label='a')
+    data_format = utility.save_data([data, non_numeric_data], tmp_path,
+                                    'npy', save_index=False)
+    assert data_format == 'csv'
+    assert sorted(path.name for path in tmp_path.iterdir()) \
+        == ['data_0.csv', 'data_1.csv']
+
+
+@pytest.mark.parametrize('data_format', ['csv', 'feather', 'parquet', 'npy'])
+def test_save_figure_in_chunks(tmp_path, monkeypatch, data_format: str):
+    if data_format in ('feather', 'parquet'):
+        pytest.importorskip('pyarrow')
+
+    # pandas writes csv chunks internally, so the chunk size it is given
+    # is recorded rather than counting the chunks in the file
+    csv_chunk_sizes = []
+    to_csv = pd.DataFrame.to_csv
+
+    def record_csv_chunk_size(df, *args, **kwargs):
+        csv_chunk_sizes.append(kwargs.get('chunksize'))
+        return to_csv(df, *args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, 'to_csv', record_csv_chunk_size)
+
+    data = generate_random_data(100)
+    save_reproducible_figure('test_fig', data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format=data_format,
+                             chunk_size=7, auto_format=False)
+
+    data_path = tmp_path / 'test_fig' / f'data_0.{data_format}'
+    n_chunks = (len(data) + 6) // 7
+    if data_format == 'csv':
+        assert csv_chunk_sizes == [7]
+    elif data_format == 'feather':
+        import pyarrow.ipc
+        assert pyarrow.ipc.open_file(data_path).num_record_batches == n_chunks
+    elif data_format == 'parquet':
+        import pyarrow.parquet as pq
+        assert pq.ParquetFile(data_path).num_row_groups == n_chunks
+    # npy is always written in one go, so only the data is checked
+
+    code_path = tmp_path / 'test_fig' / 'code.py'
+    loaded_data, = load_figure_module(code_path)._load_figure_data()
+    pd.testing.assert_frame_equal(loaded_data, data, check_dtype=False)
+
+
+@pytest.mark.parametrize('data_format', ['csv', 'feather', 'parquet', 'npy'])
+def test_save_figure_index_saved_as_column(tmp_path, data_format: str):
+    if data_format in ('feather', 'parquet'):
+        pytest.importorskip('pyarrow')
+    data = generate_random_data(10)
+    data.index = data.index * 2
+    save_reproducible_figure('test_fig', data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format=data_format,
+                             save_index=True, auto_format=False)
+    code_path = tmp_path / 'test_fig' / 'code.py'
+    loaded_data, = load_figure_module(code_path)._load_figure_data()
+    index_name = 'Unnamed: 0' if data_format == 'csv' else 'index'
+    assert list(loaded_data.columns) == [index_name, 'x', 'y']
+    assert list(loaded_data[index_name]) == list(data.index)
+
+
+@pytest.mark.parametrize('data_format', ['csv', 'feather', 'parquet', 'npy'])
+def test_save_figure_index_named_like_column(tmp_path, data_format: str):
+    if data_format in ('feather', 'parquet'):
+        pytest.importorskip('pyarrow')
+    data = generate_random_data(10)
+    data.index = pd.Index(data.index * 2, name='x')
+    save_reproducible_figure('test_fig', data, create_test_figure,
+                             figures_dir=str(tmp_path), data_format=data_format,
+                             save_index=True, auto_format=False)
+    code_path = tmp_path / 'test_fig' / 'code.py'
+    loaded_data, = load_figure_module(code_path)._load_figure_data()
+    assert len(loaded_data.columns) == 3
+    assert list(loaded_data.iloc[:, 0]) == list(data.index)
+    assert list(loaded_data['y']) == pytest.approx(list(data['y']))
+
+
+FIGURE_TITLE = 'before'
+
+
+def create_test_figure_setting_global(data: pd.DataFrame) -> plt.Figure:
+    global FIGURE_TITLE
+    FIGURE_TITLE = 'after'
+    fig = create_test_figure(data)
+    fig.suptitle(FIGURE_TITLE)
+    return fig
+
+
+def test_save_figure_global_set_by_create_figure(tmp_path):
+    save_reproducible_figure('test_fig', generate_random_data(),
+                             create_test_figure_setting_global,
+                             figures_dir=str(tmp_path), auto_format=False)
+    code = (tmp_path / 'test_fig' / 'code.py').read_text()
+    assert "FIGURE_TITLE = 'after'" in code
+
+
+def test_save_figure_closed_when_code_fails(tmp_path, monkeypatch):
+    def fail_to_build_code(*args, **kwargs):
+        raise SyntaxError('could not parse source')
+
+    monkeypatch.setattr(utility, 'build_code', fail_to_build_code)
+    plt.close('all')
+    with pytest.raises(SyntaxError):
+        save_reproducible_figure('test_fig', generate_random_data(),
+                                 create_test_figure,
+                                 figures_dir=str(tmp_path), auto_format=False)
+    assert plt.get_fignums() == []
+
+
+def read_data(data: pd.DataFrame, column: str) -> np.ndarray:
+    """Helper with the same name as a function that code.py used to define."""
+    return data[column].to_numpy()
+
+
+def create_test_figure_with_read_data_helper(data: pd.DataFrame) -> plt.Figure:
+    fig, ax = plt.subplots()
+    ax.plot(read_data(data, 'x'), read_data(data, 'y'))
+    return fig
+
+
+def test_save_figure_helper_named_like_code_functions(tmp_path):
+    data = generate_random_data()
+    fig_name = 'test_fig_read_data_helper'
+    save_reproducible_figure(fig_name, data,
+                             create_test_figure_with_read_data_helper,
+                             figures_dir=str(tmp_path), auto_format=False)
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def create_test_figure_with_kwargs(data: pd.DataFrame, value: float) -> plt.Figure:
     """Create a figure."""
     fig, ax = plt.subplots()
-    ax.plot(data.x, data.y)
-    ax.hlines(value, data.x.min(), data.x.max())
+    x = data.x.to_numpy()
+    ax.plot(x, data.y)
+    ax.hlines(value, x.min(), x.max())
     return fig
 
 
-def test_save_figure_with_kwargs():
+def test_save_figure_with_kwargs(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_with_kwargs'
     value = data.y.mean()
-    save_reproducible_figure(fig_name, data, create_test_figure_with_kwargs, value=value)
-    run_checks_after_saving(fig_name)
+    save_reproducible_figure(fig_name, data, create_test_figure_with_kwargs,
+                             figures_dir=str(tmp_path), value=value)
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def create_test_figure_multiple_frames(data1: pd.DataFrame,
                                        data2: pd.DataFrame) -> plt.Figure:
     """Create a figure."""
     fig, ax = plt.subplots()
-    ax.plot(data1.x, data1.y)
-    ax.plot(data2.x, data2.y)
+    # one column per frame, so that both lines are plotted in a single call
+    x = np.column_stack([data1.x, data2.x])
+    y = np.column_stack([data1.y, data2.y])
+    ax.plot(x, y)
     return fig
 
 
-def test_save_figure_multiple_data_frames():
+def test_save_figure_multiple_data_frames(tmp_path):
     data1 = generate_random_data()
     data2 = generate_random_data()
     data2.x = data2.x + data2.x.mean()
     fig_name = 'test_fig_multiple_data_frames'
     save_reproducible_figure(fig_name, (data1, data2),
-                             create_test_figure_multiple_frames)
-    run_checks_after_saving(fig_name)
+                             create_test_figure_multiple_frames,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
+
+
+def create_test_figure_many_frames(*frames: pd.DataFrame) -> plt.Figure:
+    """Create a figure."""
+    fig, ax = plt.subplots()
+    for frame in frames:
+        ax.plot(frame.x, frame.y)
+    return fig
+
+
+def test_save_figure_many_data_frames_order(tmp_path):
+    frames = [pd.DataFrame({'x': [i, i + 1], 'y': [i, i]}) for i in range(12)]
+    fig_name = 'test_fig_many_data_frames'
+    save_reproducible_figure(fig_name, frames, create_test_figure_many_frames,
+                             figures_dir=str(tmp_path), auto_format=False)
+    module = load_figure_module(tmp_path / fig_name / 'code.py')
+    assert [frame.x[0] for frame in module._load_figure_data()] == list(range(12))
 
 
 def create_figure_with_plotting_style(data: pd.DataFrame):
     set_plotting_style()
-    create_test_figure(data)
+    return create_test_figure(data)
 
 
-def test_save_figure_with_plotting_style():
+def test_save_figure_with_plotting_style(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_with_plotting_style'
     save_reproducible_figure(fig_name, data,
-                             create_figure_with_plotting_style)
-    # TODO: figure out how to run code that imports from the module during test
-    run_checks_after_saving(fig_name, check_code_runs=False)
+                             create_figure_with_plotting_style,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
-    """Preprocess data."""
-    data['y'] = data['y'] * 100
-    return data
+def preprocess_data(data: pd.DataFrame) -> tuple:
+    """Preprocess data, returning the x and y values to plot."""
+    y = data['y'].to_numpy(copy=True)
+    y *= 100
+    return data['x'].to_numpy(), y
 
 
 def create_test_figure_with_helper_fns(data: pd.DataFrame) -> plt.Figure:
     """Create a figure."""
     fig, ax = plt.subplots()
-    data = preprocess_data(data)
-    ax.plot(data['x'], data['y'])
+    x, y = preprocess_data(data)
+    ax.plot(x, y)
     return fig
 
 
-def test_save_figure_with_helper_fns():
+def test_save_figure_with_helper_fns(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_preprocessor'
     save_reproducible_figure(fig_name, data,
-                             create_test_figure_with_helper_fns)
-    run_checks_after_saving(fig_name)
+                             create_test_figure_with_helper_fns,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def create_nx_data() -> pd.DataFrame:
@@ -146,16 +355,20 @@ def create_nx_data() -> pd.DataFrame:
 
 
 def create_nx_figure(data: pd.DataFrame):
-    data.columns = data.index
-    graph = nx.from_pandas_adjacency(data)
-    nx.draw(graph)
+    # building from the array avoids iterating over the DataFrame's cells
+    graph = nx.from_numpy_array(data.to_numpy())
+    pos = nx.spring_layout(graph, seed=0)
+    fig, ax = plt.subplots()
+    nx.draw(graph, pos=pos, ax=ax)
+    return fig
 
 
-def test_save_figure_with_additional_imports():
+def test_save_figure_with_additional_imports(tmp_path):
     data = create_nx_data()
     fig_name = 'test_nx_fig'
-    save_reproducible_figure(fig_name, data, create_nx_figure)
-    run_checks_after_saving(fig_name)
+    save_reproducible_figure(fig_name, data, create_nx_figure,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def create_figure_with_global_vars(data: pd.DataFrame):
@@ -174,15 +387,16 @@ def create_data_for_global_vars_test():
     })
 
 
-def test_save_figure_with_global_vars():
+def test_save_figure_with_global_vars(tmp_path):
     data = create_data_for_global_vars_test()
     fig_name = 'test_fig_global_vars'
-    save_reproducible_figure(fig_name, data, create_figure_with_global_vars)
-    run_checks_after_saving(fig_name)
+    save_reproducible_figure(fig_name, data, create_figure_with_global_vars,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
-def external_fn(x):
-    return np.sqrt(x)
+def external_fn(x: np.ndarray) -> np.ndarray:
+    return np.sqrt(x, out=x)
 
 
 class HelperClass:
@@ -190,29 +404,30 @@ class HelperClass:
     def __init__(self, a: int):
         self.a = a
 
-    def internal_fn(self, x):
-        return x * self.a
+    def internal_fn(self, x: np.ndarray) -> np.ndarray:
+        return np.multiply(x, self.a, out=x)
 
-    def preprocess_data(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Preprocess data."""
-        data['y'] = self.internal_fn(data['y'])
-        data['x'] = external_fn(data['x'])
-        return data
+    def preprocess_data(self, data: pd.DataFrame) -> tuple:
+        """Preprocess data, returning the x and y values to plot."""
+        x = data['x'].to_numpy(dtype=float, copy=True)
+        y = data['y'].to_numpy(dtype=float, copy=True)
+        return external_fn(x), self.internal_fn(y)
 
 
 def create_figure_with_helper_class(data: pd.DataFrame):
     fig, ax = plt.subplots()
     helper_class = HelperClass(a=10)
-    data = helper_class.preprocess_data(data)
-    ax.plot(data['x'], data['y'])
+    x, y = helper_class.preprocess_data(data)
+    ax.plot(x, y)
     return fig
 
 
-def test_save_figure_with_helper_class():
+def test_save_figure_with_helper_class(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_helper_class'
-    save_reproducible_figure(fig_name, data, create_figure_with_helper_class)
-    run_checks_after_saving(fig_name)
+    save_reproducible_figure(fig_name, data, create_figure_with_helper_class,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def external_fn_with_internal_fn():
@@ -224,44 +439,60 @@ def external_fn_with_internal_fn():
 def create_figure_with_external_fn_with_internal_fn(data: pd.DataFrame):
     fig, ax = plt.subplots()
     preprocessor = external_fn_with_internal_fn()
-    data['x'] = preprocessor(data['x'])
-    ax.plot(data['x'], data['y'])
+    # x holds integers, so it is converted once rather than
+    # assigning a new float column back into the data frame
+    x = preprocessor(data['x'].to_numpy(dtype=float))
+    ax.plot(x, data['y'])
     return fig
 
 
-def test_save_figure_with_external_fn_with_internal_fn():
+def test_save_figure_with_external_fn_with_internal_fn(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_external_fn_with_internal_fn'
-    # this is a case where the import finder will fail
-    # because the function is defined in a function
-    # so we need to specify the dependencies of the internal fn manually
+    # the internal fn is searched as part of the function that defines it, so
+    # numpy is found automatically. It is also given as an additional import
+    # to test that additional imports are merged with the ones found
     save_reproducible_figure(fig_name, data,
                              create_figure_with_external_fn_with_internal_fn,
-                             additional_imports=['import numpy as np'])
-    run_checks_after_saving(fig_name)
+                             additional_imports=['import numpy as np'],
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
 
 
 def random_additional_fn():
     print('Unused but here anyways!')
 
 
-def test_save_figure_with_additional_fn():
+def test_save_figure_with_additional_fn(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_additional_fn'
     save_reproducible_figure(fig_name, data, create_test_figure,
-                             additional_fns=[random_additional_fn])
-    run_checks_after_saving(fig_name)
+                             additional_fns=[random_additional_fn],
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
+
+
+def test_save_figure_additional_fn_used_by_create_figure(tmp_path):
+    data = generate_random_data()
+    save_reproducible_figure('test_fig', data, create_test_figure_with_helper_fns,
+                             figures_dir=str(tmp_path), auto_format=False,
+                             additional_fns=[preprocess_data])
+    code = (tmp_path / 'test_fig' / 'code.py').read_text()
+    assert code.count('def preprocess_data(') == 1
 
 
 def create_figure_test_import_from(data: pd.DataFrame):
+    # no figure is returned, to test saving the current pyplot figure
     _, ax = plt.subplots()
+    # sqrt is deliberately called here to test `from ... import ...` imports
     k = sqrt(4)
-    ax.plot(data['x'], k * data['y'])
+    ax.plot(data['x'].to_numpy(), k * data['y'].to_numpy())
 
 
-def test_save_figure_with_imported_from_module():
+def test_save_figure_with_imported_from_module(tmp_path):
     data = generate_random_data()
     fig_name = 'test_fig_import_from'
     save_reproducible_figure(fig_name, data,
-                             create_figure_test_import_from)
-    run_checks_after_saving(fig_name)
+                             create_figure_test_import_from,
+                             figures_dir=str(tmp_path))
+    run_checks_after_saving(fig_name, figures_dir=str(tmp_path))
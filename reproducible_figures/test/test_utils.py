@@ -1,12 +1,30 @@
-from ..utility import find_imports
+from ..utility import autoformat, find_dependencies, find_imports, get_source
 
+from functools import lru_cache
 from math import sqrt
+import gc
+import weakref
+
+import numpy as np
+import pandas as pd
+import pytest
 
 
 def test_find_imports():
     """Test load_imports."""
     imports = find_imports(find_imports)
-    assert imports == ['import inspect']
+    assert imports == [
+        'from functools import lru_cache',
+        'from typing import Dict',
+        'from typing import Hashable',
+        'from typing import List',
+        'from typing import Optional',
+        'from typing import Set',
+        'from typing import Tuple',
+        'import inspect',
+        'import symtable',
+        'import textwrap',
+    ]
 
 
 def fn_using_sqrt(x):
@@ -17,3 +35,111 @@ def test_from_import():
     """Test load_imports."""
     imports = find_imports(fn_using_sqrt)
     assert imports == ['from math import sqrt']
+
+
+def fn_using_np_sqrt(x):
+    return np.sqrt(x)
+
+
+def test_attribute_not_imported():
+    """Test attributes are not mistaken for globals of the same name."""
+    imports = find_imports(fn_using_np_sqrt)
+    assert imports == ['import numpy as np']
+
+
+GLOBAL_DATA = pd.DataFrame({'x': [1, 2, 3]})
+
+
+def fn_using_global_data():
+    return GLOBAL_DATA['x'].sum()
+
+
+def test_global_data_frame():
+    """Test globals that cannot be compared with `in` are supported."""
+    imports = find_imports(fn_using_global_data)
+    assert imports == []
+
+
+def fn_with_nested_fn():
+    def nested_fn(x):
+        return np.sqrt(x)
+    return nested_fn
+
+
+def test_nested_fn_imports():
+    """Test imports used in nested functions are found."""
+    imports = find_imports(fn_with_nested_fn)
+    assert imports == ['import numpy as np']
+
+
+class ClassWithShadowedGlobal:
+
+    def transform(self, x):
+        return np.log1p(x)
+
+    def scale(self, x, np):
+        return x * np
+
+
+def test_class_global_shadowed_in_another_method():
+    """Test a name local to one method is still a global in another."""
+    imports = find_imports(ClassWithShadowedGlobal)
+    assert imports == ['import numpy as np']
+
+
+def test_get_source_cached():
+    source = get_source(fn_using_sqrt)
+    assert source.startswith('def fn_using_sqrt(x):')
+    assert get_source(fn_using_sqrt) is source
+
+
+def test_get_source_cache_does_not_keep_fn_alive():
+    def local_fn(x):
+        return x
+
+    get_source(local_fn)
+    fn_ref = weakref.ref(local_fn)
+    del local_fn
+    gc.collect()
+    assert fn_ref() is None
+
+
+@lru_cache
+def cached_fn_using_sqrt(x):
+    return sqrt(x)
+
+
+def fn_using_cached_fn(x):
+    return cached_fn_using_sqrt(x)
+
+
+def test_decorated_fn_dependencies():
+    imports, sources = find_dependencies(fn_using_cached_fn)
+    assert imports == {'from functools import lru_cache', 'from math import sqrt'}
+    assert sources[0].startswith('@lru_cache\ndef cached_fn_using_sqrt(x):')
+
+
+class AttrDict(dict):
+    __getattr__ = dict.__getitem__
+
+
+SETTINGS = AttrDict(scale=2)
+
+
+def fn_using_attr_dict(x):
+    return SETTINGS.scale * x
+
+
+def test_global_with_custom_getattr_dependencies():
+    imports, sources = find_dependencies(fn_using_attr_dict)
+    assert sources[-1].startswith('def fn_using_attr_dict(x):')
+
+
+def test_autoformat():
+    pytest.importorskip('black')
+    assert autoformat("x=[1,2 ,3]") == "x = [1, 2, 3]\n"
+
+
+def test_autoformat_invalid_code_unchanged():
+    pytest.importorskip('black')
+    assert autoformat("x = (") == "x = ("
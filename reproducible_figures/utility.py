@@ -1,24 +1,36 @@
 from types import ModuleType
-from typing import Callable, Iterable, List, Optional, Union
+from typing import (TYPE_CHECKING, Callable, Dict, Hashable, Iterable, List,
+                    Literal, Optional, Set, Tuple, Union)
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import inspect
-import subprocess
+import symtable
+import textwrap
+import weakref
 
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
+
+# pandas and pyplot are slow to import, and are not needed to find the
+# dependencies of a function, so they are imported when saving a figure
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
 
 def save_reproducible_figure(fig_name: str,
-                             fig_data: Union[pd.DataFrame, Iterable[pd.DataFrame]],
-                             create_figure: Callable[[pd.DataFrame], plt.Figure],
+                             fig_data: Union['pd.DataFrame', Iterable['pd.DataFrame']],
+                             create_figure: Callable[['pd.DataFrame'], 'plt.Figure'],
                              save_index: bool = False,
                              show: bool = False,
                              matplotlib_backend: str = 'pdf',
                              figure_file_fmt: Optional[str] = None,
-                             figures_dir: str = 'figures',
+                             figures_dir: Union[str, Path] = 'figures',
+                             data_format: Literal['csv', 'feather', 'parquet', 'npy'] = 'csv',
+                             chunk_size: Optional[int] = None,
                              auto_format: bool = True,
-                             figure_dpi: int = 1000,
+                             figure_dpi: Optional[int] = 300,
                              additional_imports: Optional[List[str]] = None,
                              additional_fns: Optional[Callable] = None,
                              **kwargs_for_create_figure):
@@ -42,11 +54,16 @@ def save_reproducible_figure(fig_name: str,
             a directory in figures_dir, and the figure will be saved
             in this directory.
         fig_data: Data used to create the figure. This will be saved
-            as a csv file in the figure directory.
+            in the figure directory in the format given by data_format.
         create_figure: Function that creates the figure. This function
             must take fig_data as input and return a matplotlib Figure
             object.
-        save_index: Whether to save the index of fig_data. Default is True.
+        save_index: Whether to save the index of fig_data. Default is False.
+            The index is saved as a regular column, so when the figure is
+            reproduced create_figure receives it as a column. In a csv an
+            unnamed index is read back as 'Unnamed: 0'. In the binary
+            formats it is named 'index', and an index named the same as a
+            column is renamed with a trailing underscore.
         show: Whether to show the figure. Default is False and the
             figure is closed after saving.
         matplotlib_backend: Backend to use for matplotlib. Default is 'pdf'.
@@ -54,10 +71,24 @@ def save_reproducible_figure(fig_name: str,
             None, which will use the matplotlib backend.
         figures_dir: Directory where the figure will be saved.
             Default is 'figures'.
-        figure_dpi: DPI to use for saving the figure. Default is 1000,
-            which will create a high resolution figure ready for publication.
+        data_format: Format to save the data in, one of 'csv', 'feather',
+            'parquet' or 'npy'. Default is 'csv', which is human readable and
+            works well with version control. The binary formats are much
+            faster to save and load for large data. 'feather' and 'parquet'
+            require pyarrow, and 'npy' only supports numeric data. If the
+            data cannot be saved in a binary format, it is saved as csv instead.
+        chunk_size: Number of rows to write at a time when saving the data.
+            Default is None, which writes each data frame in one go. Setting
+            this bounds the memory used when saving very large data frames.
+            It is not used for 'npy', which is always written in one go.
+        figure_dpi: DPI to use for saving the figure. Default is 300, which
+            is the usual print resolution for publications. Vector formats
+            such as pdf only use the DPI for images and rasterized elements,
+            so lines, markers and text are unaffected by it. A higher value
+            may be needed for raster formats such as png, and None uses
+            matplotlib's savefig.dpi setting.
         auto_format: Whether to autoformat the code. Default is True.
-            Relies on black being installed.
+            Relies on black being installed, and is skipped if it is not.
         additional_imports: Additional imports needed to create the figure.
             In most cases, this should not be needed as the automatic
             imports finder should find all the imports needed. However,
@@ -97,111 +128,376 @@ def save_reproducible_figure(fig_name: str,
             - code.py: python script that can be used to reproduce the figure
             - test_save_figure.pdf: figure file
     """
-    output_dir = f'{figures_dir}/{fig_name}'
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    output_dir = Path(figures_dir) / fig_name
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     if isinstance(fig_data, pd.DataFrame):
         fig_data = [fig_data]
+    fig_data = list(fig_data)
 
-    for i, df in enumerate(fig_data):
-        df.to_csv(f'{output_dir}/data_{i}.csv', index=save_index)
-
-    fig = create_figure(*fig_data, **kwargs_for_create_figure)
+    data_format = save_data(fig_data, output_dir, data_format,
+                            save_index, chunk_size)
 
     figure_file_fmt = figure_file_fmt or matplotlib_backend
-    if fig is not None:
-        fig.savefig(f'{output_dir}/{fig_name}.{figure_file_fmt}',
-                    bbox_inches='tight', dpi=figure_dpi)
-    else:
-        plt.savefig(f'{output_dir}/{fig_name}.{figure_file_fmt}',
-                    bbox_inches='tight', dpi=figure_dpi)
+    figure_path = output_dir / f'{fig_name}.{figure_file_fmt}'
+
+    fig = None
+    try:
+        fig = create_figure(*fig_data, **kwargs_for_create_figure)
+        if fig is None:
+            fig = plt.gcf()
+
+        # The code is built after create_figure has run, as it may change
+        # global values that are copied into the code. Formatting and
+        # writing the code do not use the figure, so they are done in the
+        # background while the figure is saved
+        code = build_code(fig_name, create_figure,
+                          data_format=data_format,
+                          matplotlib_backend=matplotlib_backend,
+                          figure_file_fmt=figure_file_fmt,
+                          figure_dpi=figure_dpi,
+                          additional_imports=additional_imports,
+                          additional_fns=additional_fns,
+                          kwargs_for_create_figure=kwargs_for_create_figure)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            code_saved = executor.submit(save_code, output_dir / 'code.py',
+                                         code, auto_format)
+            fig.savefig(figure_path, bbox_inches='tight', dpi=figure_dpi)
+            code_saved.result()
+
+    except BaseException:
+        if fig is not None:
+            plt.close(fig)
+        raise
 
     if show:
         plt.show()
     else:
-        plt.close()
+        plt.close(fig)
+
+
+def build_code(fig_name: str,
+               create_figure: Callable[['pd.DataFrame'], 'plt.Figure'],
+               data_format: str = 'csv',
+               matplotlib_backend: str = 'pdf',
+               figure_file_fmt: Optional[str] = None,
+               figure_dpi: Optional[int] = 300,
+               additional_imports: Optional[List[str]] = None,
+               additional_fns: Optional[Callable] = None,
+               kwargs_for_create_figure: Optional[dict] = None) -> str:
+    """
+    Builds a script that reproduces a figure from its saved data.
+    See save_reproducible_figure for a description of the arguments.
+    """
+    figure_file_fmt = figure_file_fmt or matplotlib_backend
 
-    # Save the code used to generate the figure
-    default_imports = ['import matplotlib',
+    default_imports = ['import matplotlib.pyplot as plt',
                        'import pandas as pd',
+                       'from concurrent.futures import ThreadPoolExecutor',
                        'from pathlib import Path']
+    default_imports += READ_DATA_IMPORTS.get(data_format, [])
     if additional_imports:
         default_imports += additional_imports
 
     if kwargs_for_create_figure:
         kwargs_str = ',' + ', '.join(
-            f'{k}={v!r}' for k, v in kwargs_for_create_figure.items()
+            f'{k}={kwarg_repr(v)}' for k, v in kwargs_for_create_figure.items()
         )
     else:
         kwargs_str = ''
 
-    if fig is None:
-        save_fig_code_prefix = "plt"
-        default_imports.append('import matplotlib.pyplot as plt')
-        create_fig_code = f"{create_figure.__name__}(*data{kwargs_str})"
-    else:
-        save_fig_code_prefix = "fig"
-        create_fig_code = f"fig = {create_figure.__name__}(*data{kwargs_str})"
+    # the search state is shared, so that imports are collected into one set
+    # and any source used by several of the functions is only included once
+    imports = set()
+    sources = []
+    searched_already = set()
+    for fn in [*(additional_fns or []), create_figure]:
+        find_dependencies(fn, imports=imports, sources=sources,
+                          searched_already=searched_already)
+    functions_source = '\n\n'.join(sources)
+
+    # matplotlib is imported and the backend selected before anything
+    # else, so that pyplot is never initialised with the default backend
+    imports = sorted((imports | set(default_imports)) - {'import matplotlib'})
+    imports_code = '\n'.join(imports)
 
-    imports = find_imports(create_figure)
+    script = SCRIPT_TEMPLATE.format_map({
+        'matplotlib_backend': matplotlib_backend,
+        'imports_code': imports_code,
+        'functions_source': functions_source,
+        'read_data_source': READ_DATA_SOURCES[data_format],
+        'data_format': data_format,
+        'create_figure_name': create_figure.__name__,
+        'kwargs_str': kwargs_str,
+        'figure_file_name': f'{fig_name}.{figure_file_fmt}',
+        'figure_dpi': figure_dpi,
+    })
 
-    if additional_fns:
-        additional_source = '\n\n'
-        for fn in additional_fns:
-            imports += find_imports(fn)
-            additional_source += build_function_source(fn) + '\n\n'
-    else:
-        additional_source = ''
+    return script
 
-    imports = sorted(set(imports + default_imports))
-    imports_code = '\n'.join(imports)
 
-    script = f"""
-{imports_code}
+def save_code(code_path: Path, code: str, auto_format: bool = True):
+    """
+    Saves the code that reproduces a figure.
+
+    Args:
+        code_path: Path to save the code to.
+        code: Code built by build_code.
+        auto_format: Whether to autoformat the code with black.
+    """
+    if auto_format:
+        code = autoformat(code)
 
+    try:
+        # the code is written in a single call, so a buffer large
+        # enough to hold it avoids splitting the write into many syscalls
+        with open(code_path, 'w', buffering=1 << 20) as f:
+            f.write(code)
 
+    except Exception as e:
+        print(f'Failed to save code: {e}')
+
+
+# Template of the code.py script saved with each figure, which is
+# filled in by build_code. The names it defines are private, so that they
+# do not replace helpers with common names (e.g. load_data) in the source
+# of create_figure, which comes before them
+SCRIPT_TEMPLATE = """
+import matplotlib
 matplotlib.use({matplotlib_backend!r})
-{additional_source}
 
-{build_function_source(create_figure)}
+{imports_code}
+
+
+{functions_source}
+
+_FIGURE_DIR = Path(__file__).resolve().parent
+
+
+{read_data_source}
+
+def _load_figure_data():
+    # sorted by index, as the names sort data_10 before data_2
+    data_paths = sorted(_FIGURE_DIR.glob('data_*.{data_format}'),
+                        key=lambda path: int(path.stem.rsplit('_', 1)[1]))
+    if len(data_paths) <= 1:
+        return [_read_figure_data(data_path) for data_path in data_paths]
+
+    # parsing releases the GIL, so multiple files can be read concurrently.
+    # The number of workers also caps how many files are being parsed at once
+    with ThreadPoolExecutor(max_workers=min(8, len(data_paths))) as executor:
+        return list(executor.map(_read_figure_data, data_paths))
+
 
 def reproduce_figure():
-    data = [
-        pd.read_csv(csv_path)
-        for csv_path in sorted(Path('{output_dir}').glob('data_*.csv'))
-    ]
-    {create_fig_code}
-    {save_fig_code_prefix}.savefig(
-        '{output_dir}/{fig_name}.{figure_file_fmt}',
+    data = _load_figure_data()
+    fig = {create_figure_name}(*data{kwargs_str})
+    if fig is None:
+        fig = plt.gcf()
+    fig.savefig(
+        _FIGURE_DIR / {figure_file_name!r},
         bbox_inches='tight', dpi={figure_dpi}
     )
+    return fig
 
 
 if __name__ == '__main__':
     reproduce_figure()
 """
 
+
+READ_DATA_SOURCES = {
+    'csv': '''
+def _read_figure_data(data_path):
+    return pd.read_csv(data_path)
+''',
+    'feather': '''
+def _read_figure_data(data_path):
+    return pd.read_feather(data_path)
+''',
+    'parquet': '''
+def _read_figure_data(data_path):
+    return pd.read_parquet(data_path)
+''',
+    'npy': '''
+def _read_figure_data(data_path):
+    return pd.DataFrame(np.load(data_path))
+''',
+}
+
+# Imports needed by the _read_figure_data source of each data format, in
+# addition to the imports that every code.py has
+READ_DATA_IMPORTS = {
+    'npy': ['import numpy as np'],
+}
+
+
+def save_data(fig_data: List['pd.DataFrame'],
+              output_dir: Path,
+              data_format: str,
+              save_index: bool,
+              chunk_size: Optional[int] = None) -> str:
+    """
+    Saves the data used to create a figure, falling back to csv if the
+    data cannot be saved in a binary format (e.g. if pyarrow is not
+    installed, or the data has a type that is not supported).
+
+    Args:
+        fig_data: Data frames used to create the figure.
+        output_dir: Directory to save the data in.
+        data_format: Format to save the data in.
+        save_index: Whether to save the index of the data frames.
+        chunk_size: Number of rows to write at a time, or None to write
+            each data frame in one go.
+
+    Returns:
+        The format that the data was saved in.
+    """
+    if data_format not in READ_DATA_SOURCES:
+        raise ValueError(f'Unsupported data format: {data_format}')
+
+    data_paths = []
     try:
-        with open(f'{output_dir}/code.py', 'w') as f:
-            f.write(script)
+        for i, df in enumerate(fig_data):
+            data_paths.append(output_dir / f'data_{i}.{data_format}')
+            save_data_frame(df, data_paths[-1],
+                            data_format, save_index, chunk_size)
+
+    except (ImportError, ValueError, TypeError, NotImplementedError) as e:
+        if data_format == 'csv':
+            raise
+        print(f'Failed to save data as {data_format}, saving as csv instead: {e}')
+        # remove the files written before the failure, so that the figure
+        # directory only contains the data that code.py reads
+        for data_path in data_paths:
+            data_path.unlink(missing_ok=True)
+        return save_data(fig_data, output_dir, 'csv', save_index, chunk_size)
+
+    return data_format
+
+
+def save_data_frame(df: 'pd.DataFrame',
+                    data_path: Path,
+                    data_format: str,
+                    save_index: bool,
+                    chunk_size: Optional[int] = None):
+    """
+    Saves a single data frame in the given format.
 
-    except Exception as e:
-        print(f'Failed to save code: {e}')
+    Args:
+        df: Data frame to save.
+        data_path: Path of the file to save the data frame to.
+        data_format: Format to save the data in.
+        save_index: Whether to save the index of the data frame.
+        chunk_size: Number of rows to write at a time, or None to write
+            the data frame in one go.
+    """
+    if data_format == 'csv':
+        df.to_csv(data_path, index=save_index, chunksize=chunk_size)
+        return
 
-    if auto_format:
-        run_autoformat(f'{output_dir}/code.py')
+    # the binary formats only support string column names, which
+    # is also what reading the data back from a csv would give
+    df = df.rename(columns=str)
+
+    if save_index:
+        # the index is saved as a regular column, as it is in a csv
+        df = df.reset_index(names=index_column_names(df))
+
+    if data_format == 'npy':
+        # a structured array keeps the name and dtype of each column
+        records = df.to_records(index=False)
+        if records.dtype.hasobject:
+            raise TypeError('npy only supports numeric data')
+        np.save(data_path, records, allow_pickle=False)
+
+    elif data_format == 'feather':
+        # feather cannot store an index, so any index left is dropped
+        df.reset_index(drop=True).to_feather(data_path, chunksize=chunk_size)
+
+    elif chunk_size is None:
+        df.to_parquet(data_path, index=False, compression='zstd')
+
+    else:
+        # converting to arrow one chunk at a time avoids holding
+        # a converted copy of the entire data frame in memory
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        with pq.ParquetWriter(data_path, schema, compression='zstd') as writer:
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start:start + chunk_size]
+                writer.write_table(pa.Table.from_pandas(
+                    chunk, schema=schema, preserve_index=False))
+
+
+def index_column_names(df: 'pd.DataFrame') -> List[str]:
+    """
+    Returns names for the columns that the index levels of a data frame are
+    saved as. These are the names of the levels, or the names pandas gives
+    unnamed levels ('index' or 'level_<i>'), with underscores added to any
+    name that is already used by a column or another level.
+
+    Args:
+        df: Data frame whose index is saved.
+
+    Returns:
+        A unique column name for each level of the index.
+    """
+    used_names = set(df.columns)
+    names = []
+    for i, name in enumerate(df.index.names):
+        if name is None:
+            name = 'index' if df.index.nlevels == 1 else f'level_{i}'
+        name = str(name)
+        while name in used_names:
+            name = f'{name}_'
+        used_names.add(name)
+        names.append(name)
+    return names
+
+
+# black's formatting mode, created on first use as black is slow to import
+_BLACK_MODE = None
+
+
+def autoformat(code: str) -> str:
+    """
+    Formats code with black, which is run in-process to avoid the cost of
+    starting a new interpreter for every figure. If black is not installed,
+    the code is returned unchanged.
+    """
+    global _BLACK_MODE
+    try:
+        import black
+    except ImportError:
+        return code
+
+    if _BLACK_MODE is None:
+        _BLACK_MODE = black.Mode()
 
-def run_autoformat(code_file: str):
-    """Runs autoformatting on the code file."""
     try:
-        # autoformat the code with black
-        res = subprocess.run(['black', code_file])
-        if res.returncode != 0:
-            print('Failed to autoformat code with black:', res.stderr)
+        return black.format_str(code, mode=_BLACK_MODE)
 
     except Exception as e:
         print(f'Failed to autoformat code with black: {e}')
+        return code
+
+
+def kwarg_repr(value) -> str:
+    """
+    Returns the source code for a keyword argument value. Numpy scalars
+    (e.g. the result of data.y.mean()) are written as Python scalars, as
+    their repr refers to numpy, which may not be imported in the code.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    return repr(value)
 
 
 PRIMITIVES = (bool, str, int, float, type(None))
@@ -212,145 +508,194 @@ def is_primitive(obj):
     return isinstance(obj, PRIMITIVES)
 
 
-def find_imports(obj,
-                 main_module: Optional[ModuleType] = None,
-                 searched_already: List[Callable] = None) -> List[str]:
+def find_imports(obj, main_module: Optional[ModuleType] = None) -> List[str]:
     """
-    Recursively finds the imports needed for a function.
+    Finds the imports needed for a function or class.
 
     Args:
-        obj: Function to find the imports for.
+        obj: Function or class to find the imports for.
         main_module: Main module of the function. Used to determine
             whether a function is defined in the main module, or
             can be imported from another module.
-        searched_already: List of functions that have already been searched.
-            This is used to avoid searching the same function multiple times.
     """
-    searched_already = searched_already or []
-    if main_module is None:
-        main_module = inspect.getmodule(obj)
-
-    searched_already.append(obj)
-    imports = []
+    imports, _ = find_dependencies(obj, main_module)
+    return sorted(imports)
 
-    for member_name, member in inspect.getmembers(obj):
-        if member_name.startswith('__'):
-            continue
-        if inspect.isfunction(member) and member not in searched_already:
-            imports += find_imports(member, main_module, searched_already)
-
-    if inspect.getmodule(obj) not in [main_module, None]:
-        module = inspect.getmodule(obj)
-        if hasattr(module, '__name__') and hasattr(obj, '__name__'):
-            imports.append(f'from {module.__name__} import {obj.__name__}')
-
-    elif inspect.isfunction(obj):
-        closure_vars = inspect.getclosurevars(obj)
-        for var_name, var_value in closure_vars.globals.items():
-            if var_value is None:
-                continue
-
-            if inspect.ismodule(var_value):
-                module_name = var_value.__name__
-                if var_name != module_name:
-                    imports.append(f'import {module_name} as {var_name}')
-                else:
-                    imports.append(f'import {module_name}')
 
-            elif var_value not in searched_already:
-                imports += find_imports(var_value, main_module, searched_already)
+def build_function_source(fn: Callable,
+                          main_module: Optional[ModuleType] = None) -> str:
+    """
+    Builds the source code for a function, preceded by the source code
+    of the functions, classes and global variables that it uses.
 
-    return sorted(set(imports))
+    Args:
+        fn: Function to build the source code for.
+        main_module: Main module of the function. Used to determine
+            whether a function is defined in the main module, or
+            can be imported from another module.
+    """
+    _, sources = find_dependencies(fn, main_module)
+    return '\n\n'.join(sources)
 
 
-def build_globals_source(closure_vars: inspect.ClosureVars,
-                         main_module: ModuleType,
-                         built_already: list) -> str:
+def find_dependencies(obj,
+                      main_module: Optional[ModuleType] = None,
+                      imports: Optional[Set[str]] = None,
+                      sources: Optional[List[str]] = None,
+                      searched_already: Optional[Set[Hashable]] = None
+                      ) -> Tuple[Set[str], List[str]]:
     """
-    Builds the source code for the global variables used in a function.
+    Recursively finds the imports and source code needed to define a
+    function or class in a standalone script.
+
+    The source of obj is parsed once, and each global name that it uses is
+    resolved against the globals of its module: modules become imports,
+    objects from other modules become `from ... import ...` statements,
+    and functions, classes and primitive values from the main module are
+    added to the source (after searching their dependencies in turn).
 
     Args:
-        closure_vars: Closure variables of the function.
+        obj: Function or class to find the dependencies for.
         main_module: Main module of the function. Used to determine
             whether a function is defined in the main module, or
             can be imported from another module.
-        built_already: List of functions that have already been built.
-            This is used to avoid building the same function multiple times.
+        imports: Set that the imports found are added to.
+        sources: List that the source code blocks are appended to. Each
+            block comes after the blocks that it depends on, with the
+            source of obj last.
+        searched_already: Keys of what has already been searched, i.e. the
+            ids of functions and classes, and the names of primitive globals.
+            This is used to avoid searching the same object multiple times.
+
+    Returns:
+        The imports and the source code blocks.
     """
-    source = ""
+    imports = set() if imports is None else imports
+    sources = [] if sources is None else sources
+    searched_already = set() if searched_already is None else searched_already
+    if main_module is None:
+        main_module = inspect.getmodule(obj)
 
-    for var_name, var_value in closure_vars.globals.items():
+    searched_already.add(id(obj))
+    source = get_source(obj)
+
+    obj_globals = getattr(obj, '__globals__', None) or vars(inspect.getmodule(obj))
+
+    for var_name in find_global_names(source):
+        if var_name not in obj_globals:
+            continue
+        var_value = obj_globals[var_name]
 
         if is_primitive(var_value):
-            source += f'{var_name} = {repr(var_value)}\n\n'
+            if var_name not in searched_already:
+                searched_already.add(var_name)
+                sources.append(f'{var_name} = {repr(var_value)}\n')
 
-        if inspect.getmodule(var_value) == main_module:
-            if inspect.isfunction(var_value) and var_value not in built_already:
-                source += build_function_source(var_value, main_module, built_already) + '\n\n'
+        elif inspect.ismodule(var_value):
+            module_name = var_value.__name__
+            if var_name != module_name:
+                imports.add(f'import {module_name} as {var_name}')
+            else:
+                imports.add(f'import {module_name}')
 
-            elif inspect.isclass(var_value):
-                return build_class_source(var_value, main_module, built_already) + '\n\n'
+        elif inspect.getmodule(var_value) not in [main_module, None]:
+            import_code = from_import_code(var_name, var_value)
+            if import_code is not None:
+                imports.add(import_code)
 
-    return source
+        # decorated functions (e.g. with functools.lru_cache) are followed
+        # through __wrapped__, and their source includes the decorators.
+        # Only attributes set by the decorator are followed, as objects
+        # with a custom __getattr__ may appear to have any attribute
+        elif inspect.isfunction(var_value) or inspect.isclass(var_value) \
+                or ('__wrapped__' in getattr(var_value, '__dict__', {})
+                    and inspect.isfunction(inspect.unwrap(var_value))):
+            if id(var_value) not in searched_already:
+                find_dependencies(var_value, main_module,
+                                  imports, sources, searched_already)
 
+    sources.append(source)
 
-def build_function_source(fn: Callable,
-                          main_module: Optional[ModuleType] = None,
-                          built_already: list = None) -> str:
-    """
-    Recursively builds the source code for a function.
+    return imports, sources
 
-    Args:
-        fn: Function to build the source code for.
-        main_module: Main module of the function. Used to determine
-            whether a function is defined in the main module, or
-            can be imported from another module.
-        built_already: List of functions that have already been built.
-            This is used to avoid building the same function multiple times.
-    """
-    built_already = built_already or []
-    built_already.append(fn)
-    main_module = main_module or inspect.getmodule(fn)
-    closure_vars = inspect.getclosurevars(fn)
 
-    source = build_globals_source(closure_vars, main_module, built_already)
+# dedented sources of functions and classes. The keys are weak references,
+# so functions that are redefined (e.g. in a notebook) are not kept alive
+_SOURCE_CACHE: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
 
-    if source != "":
-        source += '\n'
 
-    source += inspect.getsource(fn)
+def get_source(obj) -> str:
+    """
+    Returns the dedented source code of a function or class. This is cached
+    by object, as inspect.getsource searches through the whole source file,
+    and helpers shared between many figures are otherwise looked up each time.
+    A function that is redefined is a new object, so it is never stale.
+    """
+    try:
+        return _SOURCE_CACHE[obj]
+    except (KeyError, TypeError):
+        pass
 
+    source = textwrap.dedent(inspect.getsource(obj))
+    try:
+        _SOURCE_CACHE[obj] = source
+    except TypeError:
+        # objects that do not support weak references are not cached
+        pass
     return source
 
 
-def build_class_source(cls: type,
-                       main_module: Optional[ModuleType] = None,
-                       built_already: Optional[list] = None) -> str:
+def from_import_code(var_name: str, var_value) -> Optional[str]:
+    """
+    Builds the `from ... import ...` statement for an object defined in
+    another module, or returns None if it cannot be imported by name
+    (e.g. types.ModuleType, which claims to be `module` in `builtins`).
     """
-    Builds the source code for a class.
+    module = inspect.getmodule(var_value)
+    obj_name = getattr(var_value, '__name__', None)
+    if obj_name is None or getattr(module, obj_name, None) is not var_value:
+        return None
 
-    Args:
-        cls: Class to build the source code for.
-        main_module: Main module of the function. Used to determine
-            whether an object is defined in the main module, or
-            can be imported from another module.
-        built_already: List of functions that have already been built.
-            This is used to avoid building the same function multiple times.
+    if var_name != obj_name:
+        return f'from {module.__name__} import {obj_name} as {var_name}'
+    return f'from {module.__name__} import {obj_name}'
+
+
+def collect_global_names(table: symtable.SymbolTable,
+                         global_names: Dict[str, None]):
     """
-    built_already = built_already or []
-    built_already.append(cls)
+    Adds the global names used in a symbol table and its child tables to
+    global_names, in the order that they first appear.
 
-    main_module = main_module or inspect.getmodule(cls)
+    Args:
+        table: Symbol table of a scope, e.g. a module, class or function.
+        global_names: Ordered dictionary that the names are added to.
+    """
+    for symbol in table.get_symbols():
+        # names declared global are included even if they are only assigned,
+        # as e.g. `global count; count += 1` still needs count to be defined
+        if symbol.is_global() and (symbol.is_referenced()
+                                   or symbol.is_declared_global()):
+            global_names.setdefault(symbol.get_name(), None)
 
-    source = ""
-    for var_name, var_value in inspect.getmembers(cls):
-        if var_name.startswith('__'):
-            continue
+    for child in table.get_children():
+        collect_global_names(child, global_names)
 
-        if inspect.isfunction(var_value):
-            closure_vars = inspect.getclosurevars(var_value)
-            source += build_globals_source(closure_vars, main_module, built_already) + '\n\n'
 
-    source += inspect.getsource(cls)
+@lru_cache(maxsize=1024)
+def find_global_names(source: str) -> Tuple[str, ...]:
+    """
+    Finds the global names used in the source code of a function or class.
+    Names are resolved in each scope like the compiler does, so a name that
+    is local to one method is still found where another method uses it as
+    a global. Attribute names are not collected, e.g. `np.sqrt` only uses
+    `np`. The result only depends on the source, so it is cached, and
+    helpers shared by many figures are only parsed once.
 
-    return source
+    Args:
+        source: Source code of a function or class definition.
+    """
+    global_names: Dict[str, None] = {}
+    collect_global_names(symtable.symtable(source, '<source>', 'exec'),
+                         global_names)
+    return tuple(global_names)